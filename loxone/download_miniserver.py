@@ -27,11 +27,7 @@ def download_latest_config(server: str, user: str, password: str) -> io.BytesIO:
     # 6. /prog/sps_old.zip
     # 7. /prog/sps.LoxPLAN (a very old fileformat)
     # 8. /prog/Default.Loxone or /prog/DefaultGo.Loxone, depending on the type of the Miniserver
-    filelist = []
-    for line in ftp.nlst():
-        if line.startswith('sps_') and (line.endswith('.zip') or line.endswith('.LoxCC')):
-            filelist.append(line)
-    filename = sorted(filelist)[-1]
+    filename = max(line for line in ftp.nlst() if line.startswith('sps_') and line.endswith(('.zip', '.LoxCC')))
 
     buffer = io.BytesIO()
     ftp.retrbinary(f'RETR /prog/{filename}', buffer.write)
@@ -49,23 +45,17 @@ def uncompress(download: io.BytesIO) -> io.BytesIO:
             return io.BytesIO(file.read())
 
 
-def decode(file: io.BytesIO) -> bytearray:
-    header = struct.unpack('<L', file.read(4))[0]
-    if header != 0xaabbccee:  # magic word to detect a compressed file
-        print('wrong header', file=sys.stderr)
-        return None
-
-    compressedSize, uncompressedSize, checksum = struct.unpack('<LLL', file.read(12))
-    data = file.read(compressedSize)
+def _lz_decode(data: bytes, out: bytearray) -> int:
+    view = memoryview(data)
     index = 0
-    result = bytearray()
+    written = 0
     while index < len(data):
         # the first byte contains the number of bytes to copy in the upper
         # nibble. If this nibble is 15, then another byte follows with
         # the remainder of bytes to copy. (Comment: it might be possible that
         # it follows the same scheme as below, which means: if more than
         # 255+15 bytes need to be copied, another 0xff byte follows and so on)
-        byte = struct.unpack('<B', data[index:index + 1])[0]
+        byte = data[index]
         index += 1
         copyBytes = byte >> 4
         byte &= 0xf
@@ -77,13 +67,14 @@ def decode(file: io.BytesIO) -> bytearray:
                 if addByte != 0xff:
                     break
         if copyBytes > 0:
-            result += data[index:index + copyBytes]
+            out[written:written + copyBytes] = view[index:index + copyBytes]
             index += copyBytes
+            written += copyBytes
         if index >= len(data):
             break
         # Reference to data which already was copied into the result.
         # bytesBack is the offset from the end of the string
-        bytesBack = struct.unpack('<H', data[index:index + 2])[0]
+        bytesBack = data[index] | (data[index + 1] << 8)
         index += 2
         # the number of bytes to be transferred is at least 4 plus the lower
         # nibble of the package header.
@@ -91,25 +82,48 @@ def decode(file: io.BytesIO) -> bytearray:
         if byte == 15:
             # if the header was 15, then more than 19 bytes need to be copied.
             while True:
-                val = struct.unpack('<B', data[index:index + 1])[0]
+                val = data[index]
                 bytesBackCopied += val
                 index += 1
                 if val != 0xff:
                     break
-        # Duplicating the last byte in the buffer multiple times is possible,
-        # so we need to account for that.
-        while bytesBackCopied > 0:
-            if -bytesBack + 1 == 0:
-                result += result[-bytesBack:]
-            else:
-                result += result[-bytesBack:-bytesBack + 1]
-            bytesBackCopied -= 1
-    if checksum != zlib.crc32(result):
-        print('Invalid checksum', file=sys.stderr)
+        if bytesBack <= 0 or bytesBack > written:
+            raise ValueError(f'invalid back reference {bytesBack}')
+        start = written - bytesBack
+        if bytesBack >= bytesBackCopied:
+            out[written:written + bytesBackCopied] = out[start:start + bytesBackCopied]
+        else:
+            # Duplicating the last bytes in the buffer multiple times is possible,
+            # so the referenced pattern is repeated to fill the overlapping part.
+            pattern = bytes(out[start:written])
+            repeat, remainder = divmod(bytesBackCopied, bytesBack)
+            out[written:written + bytesBackCopied] = pattern * repeat + pattern[:remainder]
+        written += bytesBackCopied
+    return written
+
+
+def decode(file: io.BytesIO) -> bytearray:
+    header = struct.unpack('<L', file.read(4))[0]
+    if header != 0xaabbccee:  # magic word to detect a compressed file
+        print('wrong header', file=sys.stderr)
         return None
 
-    if len(result) != uncompressedSize:
-        print(f'Uncompressed filesize is wrong {len(result)} != {uncompressedSize}', file=sys.stderr)
+    compressedSize, uncompressedSize, checksum = struct.unpack('<LLL', file.read(12))
+    data = file.read(compressedSize)
+    # the size of the result is known upfront, so decode into a preallocated buffer
+    result = bytearray(uncompressedSize)
+    try:
+        written = _lz_decode(data, result)
+    except (IndexError, ValueError):
+        print('Invalid compressed data', file=sys.stderr)
+        return None
+
+    if written != uncompressedSize:
+        print(f'Uncompressed filesize is wrong {written} != {uncompressedSize}', file=sys.stderr)
+        return None
+
+    if checksum != zlib.crc32(memoryview(result)):
+        print('Invalid checksum', file=sys.stderr)
         return None
 
     return result
@@ -20,16 +20,20 @@ import secrets
 import struct
 import tzlocal
 import urllib
+import uuid
 import websockets
 
 
 UUID = '22629cef-e3ec-4e71-95c5-eefcae9ac1c2'
 PERMISSION = 2
 INFO = 'shadowhunt'
+HEADER = struct.Struct('<BBBBI')
+EVENT = struct.Struct('<16sd')
+COLUMNS = ('id', 'time', 'name', 'temperature', 'temperature_target', 'humidity', 'light', 'shading', 'valve', 'ventilation')
 
 
-def get_miniserver_public_key(server: str) -> str:
-    response = requests.get(f'http://{server}/jdev/sys/getPublicKey')
+def get_miniserver_public_key(session: requests.Session, server: str) -> str:
+    response = session.get(f'http://{server}/jdev/sys/getPublicKey')
     key = response.json()['LL']['value']
     # make proper public key
     key = key.replace('-----BEGIN CERTIFICATE-----', '-----BEGIN PUBLIC KEY-----\n')
@@ -37,8 +41,8 @@ def get_miniserver_public_key(server: str) -> str:
     return key
 
 
-def get_miniserver_info(server: str) -> dict:
-    response = requests.get(f'http://{server}/jdev/cfg/apiKey')
+def get_miniserver_info(session: requests.Session, server: str) -> dict:
+    response = session.get(f'http://{server}/jdev/cfg/apiKey')
     value = response.json()['LL']['value']
     value = value.replace("'", '"')  # make proper json
     return json.loads(value)
@@ -55,10 +59,11 @@ def calculate_real_server(info: dict, server: str) -> str:
     return f'{ip}.{serial}.dyndns.loxonecloud.com'
 
 
-def create_session_key(aes_key: str, aes_iv: str, public_key: str) -> str:
+def create_session_key(aes_key: bytes, aes_iv: bytes, public_key: str) -> str:
     pub_key = RSA.importKey(public_key)
     encryptor = PKCS1_v1_5.new(pub_key)
-    sessionkey = encryptor.encrypt(bytes(f'{aes_key}:{aes_iv}', 'utf-8'))
+    # the miniserver expects the key and iv as hex text
+    sessionkey = encryptor.encrypt(bytes(f'{aes_key.hex()}:{aes_iv.hex()}', 'utf-8'))
     return base64.b64encode(sessionkey).decode()
 
 
@@ -69,35 +74,29 @@ def determine_secure(info: dict) -> str:
 
 
 def zero_pad(message: bytes) -> bytes:
-    return message + b'\0' * (AES.block_size - len(message) % AES.block_size)
+    return message.ljust((len(message) // AES.block_size + 1) * AES.block_size, b'\0')
 
 
-def calculate_hash(secure: str, server: str, user: str, password: str) -> str:
-    response = requests.get(f'http{secure}://{server}/jdev/sys/getkey2/{user}')
+def calculate_hash(session: requests.Session, secure: str, server: str, user: str, password: str) -> str:
+    response = session.get(f'http{secure}://{server}/jdev/sys/getkey2/{user}')
     value = response.json()['LL']['value']
     user_key = binascii.unhexlify(value['key'])
     hash_algo = value['hashAlg']
     user_salt = value['salt']
 
     password_cipher = hashlib.new(hash_algo)
-    password_cipher.update(bytes(f'{password}:{user_salt}', 'utf-8'))
-    password_hash = password_cipher.hexdigest()
-    password_hash = password_hash.upper()
-    message = bytes(f'{user}:{password_hash}', 'utf-8')
+    password_cipher.update(f'{password}:{user_salt}'.encode())
+    password_hash = password_cipher.hexdigest().upper()
+    message = f'{user}:{password_hash}'.encode()
 
     token_cipher = hmac.new(user_key, message, hash_algo)
     return token_cipher.hexdigest()
 
 
 def parseTable(eventTable: bytes) -> dict:
-    result = dict()
-    for i in range(0, len(eventTable), 24):
-        uuid = struct.unpack_from('<I2H8B', eventTable, i)
-        uuid = f'{uuid[0]:08x}-{uuid[1]:04x}-{uuid[2]:04x}-{uuid[3]:02x}{uuid[4]:02x}{uuid[5]:02x}{uuid[6]:02x}{uuid[7]:02x}{uuid[8]:02x}{uuid[9]:02x}{uuid[10]:02x}'
-
-        result[uuid] = struct.unpack_from('<d', eventTable, i + 16)[0]
-
-    return result
+    # every entry consists of a 16 byte uuid followed by a double value, the
+    # uuid is kept in its raw (little endian) form and only looked up on demand
+    return dict(EVENT.iter_unpack(eventTable))
 
 
 async def websocket_send(websocket, message: str) -> None:
@@ -106,20 +105,20 @@ async def websocket_send(websocket, message: str) -> None:
     await websocket.recv()
 
 
-async def websocket_connect(secure: str, server: str, user: str, password: str, public_key: str) -> dict:
+async def websocket_connect(session: requests.Session, secure: str, server: str, user: str, password: str, public_key: str) -> dict:
     # Step 4
-    aes_key = secrets.token_hex(32)
-    # print(f'aes_key: {aes_key}')
+    aes_key = secrets.token_bytes(32)
+    # print(f'aes_key: {aes_key.hex()}')
 
     # Step 5
-    aes_iv = secrets.token_hex(16)
-    # print(f'aes_iv: {aes_iv}')
+    aes_iv = secrets.token_bytes(16)
+    # print(f'aes_iv: {aes_iv.hex()}')
 
     # Step 6
     session_key = create_session_key(aes_key, aes_iv, public_key)
     # print(f'session_key: {session_key}')
 
-    async with websockets.connect(f'ws{secure}://{server}/ws/rfc6455') as websocket:
+    async with websockets.connect(f'ws{secure}://{server}/ws/rfc6455', compression=None) as websocket:
         # Step 7
         await websocket_send(websocket, f'jdev/sys/keyexchange/{session_key}')
 
@@ -128,7 +127,7 @@ async def websocket_connect(secure: str, server: str, user: str, password: str,
         # print(f'salt: {salt}')
 
         # Step 9.b
-        user_hash = calculate_hash(secure, server, user, password)
+        user_hash = calculate_hash(session, secure, server, user, password)
         token_command = f'salt/{salt}/jdev/sys/getjwt/{user_hash}/{user}/{PERMISSION}/{UUID}/{INFO}'
         encrypted_command = encrypt_command(aes_key, aes_iv, token_command)
         await websocket_send(websocket, f'jdev/sys/enc/{encrypted_command}')
@@ -138,7 +137,7 @@ async def websocket_connect(secure: str, server: str, user: str, password: str,
 
         while True:
             response = await websocket.recv()
-            bin_type, identifier, info, reserved, size = struct.unpack_from('<BBBBI', response)
+            bin_type, identifier, info, reserved, size = HEADER.unpack_from(response)
             assert bin_type == 0x3, 'must be binary type (0x3)'
             assert info == 0x0, 'must be empty'
             assert reserved == 0x0, 'must be empty'
@@ -153,20 +152,20 @@ def calculate_boolean(values: list) -> bool:
     if not values:
         return None
 
-    for value in values:
-        if bool(value):
-            return True
-    return False
+    return any(values)
 
 
-def calculate_average(values: list) -> bool:
+def calculate_average(values: list) -> float:
     if not values:
         return None
 
-    result = 0.0
-    for value in values:
-        result = result + value
-    return result / len(values)
+    return sum(values) / len(values)
+
+
+AGGREGATES = {
+    'light': calculate_boolean,
+    'ventilation': calculate_boolean,
+}
 
 
 def get_database_connection(config, database: str):
@@ -187,11 +186,17 @@ def generate_statement(pairs: list) -> str:
         if value is None:
             values.append('NULL')
         else:
+            value = str(value).replace("'", "''")
             values.append(f"'{value}'")
 
     return f'INSERT INTO room ({", ".join(keys)}) VALUES({", ".join(values)}) ON CONFLICT (time, id) DO NOTHING;'
 
 
+def generate_sql(columns: tuple) -> str:
+    values = ['%s'] * len(columns)
+    return f'INSERT INTO room ({", ".join(columns)}) VALUES({", ".join(values)}) ON CONFLICT (time, id) DO NOTHING;'
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description='export data from Loxone to PostgreSQL', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--server', default='miniserver', type=str, help='Loxone miniserver hostname')
@@ -207,22 +212,25 @@ def main() -> None:
     config = configparser.ConfigParser()
     config.read(arguments.config)
 
+    session = requests.Session()
+
     # Step 1
-    info = get_miniserver_info(arguments.server)
+    info = get_miniserver_info(session, arguments.server)
 
     if arguments.use_local_ddns:
         arguments.server = calculate_real_server(info, arguments.server)
 
     # Step 2
-    public_key = get_miniserver_public_key(arguments.server)
+    public_key = get_miniserver_public_key(session, arguments.server)
 
     secure = determine_secure(info)
     # Step 3
-    data = asyncio.run(websocket_connect(secure, arguments.server, arguments.user, arguments.password, public_key))
+    data = asyncio.run(websocket_connect(session, secure, arguments.server, arguments.user, arguments.password, public_key))
     if False:
         with open('loxone-dump.txt', 'w', encoding='utf-8') as file:
             for key, value in data.items():
-                file.write(key)
+                uuid0, uuid1, uuid2, uuid3 = struct.unpack('<I2H8s', key)
+                file.write(f'{uuid0:08x}-{uuid1:04x}-{uuid2:04x}-{uuid3.hex()}')
                 file.write(' ')
                 file.write(str(value))
                 file.write('\n')
@@ -232,6 +240,7 @@ def main() -> None:
     now = now.replace(second=0, microsecond=0)
     now = now.astimezone(tzlocal.get_localzone()).isoformat()
     statements = []
+    rows = []
     for section in config.sections():
         pairs = []
         pairs.append(('id', section))
@@ -246,16 +255,14 @@ def main() -> None:
             for v in listing:
                 if v == '' or v is None:
                     continue
-                values.append(data[v])
+                values.append(data[uuid.UUID(v).bytes_le])
 
-            if key == 'light' or key == 'ventilation':
-                value = calculate_boolean(values)
-            else:
-                value = calculate_average(values)
-
-            pairs.append((key, value))
+            aggregate = AGGREGATES.get(key, calculate_average)
+            pairs.append((key, aggregate(values)))
         statement = generate_statement(pairs)
         statements.append(statement)
+        row = dict(pairs)
+        rows.append(tuple(row.get(column) for column in COLUMNS))
 
     cache_file = pathlib.Path(arguments.sql_file)
     cache_file.parent.mkdir(parents=True, exist_ok=True)
@@ -268,16 +275,13 @@ def main() -> None:
     db_config.read(arguments.db_settings)
     with get_database_connection(db_config, arguments.database) as database:
         cursor = database.cursor()
-        for statement in statements:
-            cursor.execute(statement)
+        cursor.executemany(generate_sql(COLUMNS), rows)
         cursor.close()
         database.commit()
 
 
-def encrypt_command(aes_key: str, aes_iv: str, command: str) -> str:
-    key = binascii.unhexlify(aes_key)
-    iv = binascii.unhexlify(aes_iv)
-    cipher = AES.new(key, AES.MODE_CBC, iv=iv)
+def encrypt_command(aes_key: bytes, aes_iv: bytes, command: str) -> str:
+    cipher = AES.new(aes_key, AES.MODE_CBC, iv=aes_iv)
     padded = zero_pad(bytes(command, 'utf-8'))
     encrypted_msg = cipher.encrypt(padded)
     b64encoded = base64.b64encode(encrypted_msg)
@@ -5,6 +5,42 @@ import argparse
 import configparser
 import xml.etree.ElementTree
 
+SECTIONS = ('temperature', 'temperature_target', 'humidity', 'light', 'shading', 'valve', 'ventilation')
+
+
+def handle_heating(node: xml.etree.ElementTree.Element, room: dict, referenced_inputs: set) -> None:
+    for target in node.findall('./Co/[@K="AQt"]'):
+        room['temperature_target'].append(target.attrib['U'])
+    for target in node.findall('./Co/[@K="Temp"]'):
+        room['temperature'].append(target.attrib['U'])
+
+
+def handle_light(node: xml.etree.ElementTree.Element, room: dict, referenced_inputs: set) -> None:
+    for target in node.findall('./Co'):
+        if target.attrib['K'].startswith('AQ'):
+            uuid = target.attrib['U']
+            if uuid in referenced_inputs:
+                room['light'].append(uuid)
+
+
+def handle_valve(node: xml.etree.ElementTree.Element, room: dict, referenced_inputs: set) -> None:
+    room['valve'].append(node.attrib['U'])
+
+
+def handle_humidity(node: xml.etree.ElementTree.Element, room: dict, referenced_inputs: set) -> None:
+    if node.attrib['Title'] == 'Luftfeuchte':
+        room['humidity'].append(node.attrib['U'])
+
+
+HANDLERS = {
+    'HeatIRoomController2': handle_heating,
+    'LightController2': handle_light,
+    'LoxAIRAactor': handle_valve,
+    'TreeAactor': handle_valve,
+    'LoxAIRAsensor': handle_humidity,
+    'TreeAsensor': handle_humidity,
+}
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(description='extract sensor information from Loxone Configuration', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -19,64 +55,28 @@ def main() -> None:
     rooms = dict()
     for node in root.findall('.//C[@Type="PlaceCaption"]/C[@Type="Place"]'):
         attributes = node.attrib
-        rooms[attributes['U']] = {'id': attributes['U'], 'name': attributes['Title'], 'temperature': [], 'temperature_target': [], 'humidity': [], 'light': [], 'shading': [], 'valve': [], 'ventilation': []}
+        rooms[attributes['U']] = {'id': attributes['U'], 'name': attributes['Title'], **{section: [] for section in SECTIONS}}
+
+    # index all inputs referenced by outputs once, instead of searching the whole tree per candidate
+    referenced_inputs = {node.attrib['Input'] for node in root.findall('.//C[@Type="OutputRef"]/Co/In[@Input]')}
 
     for node in root.findall('.//C'):
+        handler = HANDLERS.get(node.attrib['Type'])
+        if handler is None:
+            continue
+
         room = None
         for ioData in node.findall('./IoData/[@Pr]'):
             room = rooms[ioData.attrib['Pr']]
-
-        attributes = node.attrib
-        id = attributes['U']
-        if attributes['Type'] == 'HeatIRoomController2':
-            for target in node.findall('./Co/[@K="AQt"]'):
-                room['temperature_target'].append(target.attrib['U'])
-            for target in node.findall('./Co/[@K="Temp"]'):
-                room['temperature'].append(target.attrib['U'])
-            continue
-
-        if attributes['Type'] == 'LightController2':
-            for target in node.findall('./Co'):
-                if target.attrib['K'].startswith('AQ'):
-                    uuid = target.attrib['U']
-                    if root.findall(f'.//C[@Type="OutputRef"]/Co/In[@Input="{uuid}"]'):
-                        room['light'].append(uuid)
-            continue
-
-        if attributes['Type'] == 'LoxAIRAactor':
-            room['valve'].append(id)
-            continue
-
-        if attributes['Type'] == 'TreeAactor':
-            room['valve'].append(id)
-            continue
-
-        if attributes['Type'] == 'LoxAIRAsensor':
-            if attributes['Title'] == 'Luftfeuchte':
-                room['humidity'].append(id)
-                continue
-
-        if attributes['Type'] == 'TreeAsensor':
-            if attributes['Title'] == 'Luftfeuchte':
-                room['humidity'].append(id)
-                continue
+        handler(node, room, referenced_inputs)
 
     config = configparser.ConfigParser()
     for room in sorted(rooms.values(), key=lambda item: item['name']):
-        if len(room['temperature']) + len(room['temperature_target']) + len(room['humidity']) + len(room['light']) + len(room['shading']) + len(room['valve']) + len(room['ventilation']) <= 0:
+        if not any(room[section] for section in SECTIONS):
             # skip rooms without sensors or actors
             continue
 
-        config[room['id']] = {
-            'name': room['name'],
-            'temperature': '|'.join(room['temperature']),
-            'temperature_target': '|'.join(room['temperature_target']),
-            'humidity': '|'.join(room['humidity']),
-            'light': '|'.join(room['light']),
-            'shading': '|'.join(room['shading']),
-            'valve': '|'.join(room['valve']),
-            'ventilation': '|'.join(room['ventilation']),
-        }
+        config[room['id']] = {'name': room['name'], **{section: '|'.join(room[section]) for section in SECTIONS}}
 
     with open(arguments.output, 'w') as configfile:
         config.write(configfile)
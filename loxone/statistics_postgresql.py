@@ -2,12 +2,15 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import concurrent.futures
 import configparser
 import datetime
 import dateutil.rrule
+import io
+import operator
 import psycopg
 import requests
-import time
+import requests.adapters
 import xml.etree.ElementTree
 
 SECTIONS = ['temperature', 'humidity', 'shading', 'valve', 'ventilation']
@@ -18,20 +21,14 @@ def average(values: list) -> float:
     if count == 0:
         return None
 
-    sum = 0
-    for value in values:
-        sum += value
-    return sum / count
+    return sum(values) / count
 
 
 def atleast_one(values: list) -> bool:
     if len(values) == 0:
         return None
 
-    for value in values:
-        if bool(value):
-            return True
-    return False
+    return any(values)
 
 
 def consolidate(values: dict) -> None:
@@ -71,6 +68,14 @@ def generate_sql(sections: list) -> str:
     return f'INSERT INTO room ({", ".join(columns)}) VALUES({", ".join(values)}) ON CONFLICT (time, id) DO NOTHING;'
 
 
+def fetch_statistics(session: requests.Session, url: str) -> bytes:
+    response = session.get(url)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.content
+
+
 def main() -> None:
     now = datetime.date.today()
     parser = argparse.ArgumentParser(description='export data from Loxone to PostgreSQL', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -82,6 +87,7 @@ def main() -> None:
     parser.add_argument('--database', default='postgresql', help='database config to use')
     parser.add_argument('--db-settings', default='database.ini', type=str, help='file containing postgresql connection configuration')
     parser.add_argument('--loxone-settings', default='loxone.ini', type=str, help='file containing loxone sensor configuration')
+    parser.add_argument('--workers', default=8, type=int, help='number of concurrent requests to the miniserver')
 
     arguments = parser.parse_args()
     before = datetime.datetime.strptime(arguments.before, '%Y-%m').date()
@@ -92,38 +98,52 @@ def main() -> None:
     inserts = []
     session = requests.Session()
     session.auth = (arguments.user, arguments.password)
+    # back off only when the miniserver signals overload, a 404 just means there is no data for that month
+    retry = requests.adapters.Retry(total=3, backoff_factor=0.1, status_forcelist=[429, 503])
+    adapter = requests.adapters.HTTPAdapter(pool_connections=arguments.workers, pool_maxsize=arguments.workers, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    dates = list(dateutil.rrule.rrule(dateutil.rrule.MONTHLY, dtstart=after, until=before))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=arguments.workers) as executor:
+        for room_id in loxone_config.sections():
+            room = loxone_config[room_id]
+            jobs = []
+            for section in SECTIONS:
+                for device_id in room[section].split('|'):
+                    if len(device_id) <= 0:
+                        continue
 
-    for room_id in loxone_config.sections():
-        room = loxone_config[room_id]
-        blubber = dict()
-        for section in SECTIONS:
-            for device_id in room[section].split('|'):
-                if len(device_id) <= 0:
+                    for date in dates:
+                        jobs.append((section, f'{arguments.server}/stats/{device_id}.{date:%Y%m}.xml'))
+
+            blubber = dict()
+            contents = executor.map(lambda job: fetch_statistics(session, job[1]), jobs)
+            for (section, _), content in zip(jobs, contents):
+                if content is None:
                     continue
 
-                for date in dateutil.rrule.rrule(dateutil.rrule.MONTHLY, dtstart=after, until=before):
-                    url = f'{arguments.server}/stats/{device_id}.{date:%Y%m}.xml'
-                    response = session.get(url)
-                    if response.status_code == 404:
-                        time.sleep(1)
+                # stream the samples instead of building the whole tree of a month first
+                for _, node in xml.etree.ElementTree.iterparse(io.BytesIO(content), events=('end',)):
+                    if node.tag != 'S':
                         continue
-                    response.raise_for_status()
-
-                    root = xml.etree.ElementTree.fromstring(response.content)
-                    for node in root.findall('.//S'):
-                        attributes = node.attrib
-                        timestamp = datetime.datetime.strptime(attributes['T'], '%Y-%m-%d %H:%M:%S')
-                        key = f'{attributes["T"]}/{room_id}'
-                        value = float(attributes['V'])
-                        if key not in blubber:
-                            entry = {'time': timestamp, 'id': room_id, 'name': room['name'], 'temperature': [], 'humidity': [], 'shading': [], 'valve': [], 'ventilation': []}
-                            blubber[key] = entry
-                        blubber[key][section].append(value)
-        consolidate(blubber)
-        propagate(blubber)
-        for value in blubber.values():
-            inserts.append(list(value.values()))
-        inserts.sort(key=lambda x: f'{x[0]}|{x[1]}')
+
+                    attributes = node.attrib
+                    key = f'{attributes["T"]}/{room_id}'
+                    value = float(attributes['V'])
+                    entry = blubber.get(key)
+                    if entry is None:
+                        # fixed 'YYYY-MM-DD HH:MM:SS' format, parsed only once per key
+                        timestamp = datetime.datetime.fromisoformat(attributes['T'])
+                        entry = {'time': timestamp, 'id': room_id, 'name': room['name'], 'temperature': [], 'humidity': [], 'shading': [], 'valve': [], 'ventilation': []}
+                        blubber[key] = entry
+                    entry[section].append(value)
+                    node.clear()
+            consolidate(blubber)
+            propagate(blubber)
+            for value in blubber.values():
+                inserts.append(list(value.values()))
+    inserts.sort(key=operator.itemgetter(0, 1))
 
     db_config = configparser.ConfigParser()
     db_config.read(arguments.db_settings)